@@ -1,15 +1,16 @@
 from azure.storage.blob import BlobServiceClient
 from uuid import uuid4 as uuid
+from functools import lru_cache
 from azure.core.exceptions import ResourceNotFoundError
-from azure.mgmt.resource import ResourceManagementClient
-from azure.mgmt.storage import StorageManagementClient
 from acido.azure_utils.ManagedIdentity import ManagedAuthentication, Resources
-from huepy import *
+from huepy import good
 import os
 
 __authors__ = "Juan Ramón Higueras Pica (jrhigueras@dabbleam.com)"
 __coauthor__ = "Xavier Álvarez Delgado (xalvarez@merabytes.com)"
 
+BLOB_CLIENT_CACHE_SIZE = 1024
+
 class BlobManager(ManagedAuthentication):
     service_client = None
     container_client = None
@@ -22,6 +23,7 @@ class BlobManager(ManagedAuthentication):
         account_key: str = None,
         conn_str: str = None,
     ):  
+        self._blob_clients = {}
         conn_str = os.getenv('BLOB_CONNECTION', None)
         if account_name and account_key:
             self.service_client = BlobManager.auth(account_name, account_key)
@@ -29,14 +31,18 @@ class BlobManager(ManagedAuthentication):
             self.account_key = account_key
         elif conn_str:
             self.service_client = BlobServiceClient.from_connection_string(
-                conn_str
+                conn_str,
+                transport=BlobManager.transport()
             )
         else:
+            # Only this path provisions the storage account, so only it
+            # pays for the management SDK import.
+            from azure.mgmt.storage import StorageManagementClient
+
             resource_group_name = resource_group
             self.url = f"https://{account_name}.blob.core.windows.net"
             credential = self.get_credential(Resources.BLOB)
             subscription = self.extract_subscription(credential)
-            self._resource_client = ResourceManagementClient(credential, subscription)
             self._client = StorageManagementClient(
                 credential,
                 subscription
@@ -64,21 +70,24 @@ class BlobManager(ManagedAuthentication):
             )
 
     @staticmethod
+    @lru_cache(maxsize=32)
     def auth(account_name: str, account_key: str):
+        # Clients are cached per account so repeated auth() calls share one
+        # pipeline and connection pool instead of building new ones.
         conn_str = (
             "DefaultEndpointsProtocol=https;"
             "AccountName={name};AccountKey={key};"
             "EndpointSuffix=core.windows.net"
         )
         return BlobServiceClient.from_connection_string(
-            conn_str=conn_str.format(name=account_name, key=account_key)
+            conn_str=conn_str.format(name=account_name, key=account_key),
+            transport=BlobManager.transport()
         )
 
     def check_access(self, client: BlobServiceClient) -> bool:
         try:
-            client.list_containers().next()
-        except Exception as e:
-            print(e)
+            client.get_service_properties()
+        except Exception:
             return False
         return True
 
@@ -90,6 +99,7 @@ class BlobManager(ManagedAuthentication):
         container_name: str,
         create_if_not_exists: bool = False
     ) -> bool:
+        self._blob_clients.clear()
         self.container_client = self.service_client.get_container_client(
             container_name
         )
@@ -98,17 +108,26 @@ class BlobManager(ManagedAuthentication):
         except ResourceNotFoundError as e:
             if e.status_code == 404 and create_if_not_exists:
                 self.container_client.create_container()
-                self.container_client = self.service_client.get_container_client(
-                    container_name
-                )
             else:
                 return False
         return True
 
-    def ls(self):
+    def blob_client(self, filename: str):
+        client = self._blob_clients.get(filename)
+        if client is None:
+            if len(self._blob_clients) >= BLOB_CLIENT_CACHE_SIZE:
+                self._blob_clients.pop(next(iter(self._blob_clients)), None)
+            client = self.container_client.get_blob_client(filename)
+            self._blob_clients[filename] = client
+        return client
+
+    def ls(self, include: list = None, name_starts_with: str = None):
         if not self.container_client:
             return []
-        return self.container_client.list_blobs(include=['metadata', 'tags'])
+        return self.container_client.list_blobs(
+            name_starts_with=name_starts_with,
+            include=include
+        )
 
     def upload(
         self,
@@ -126,48 +145,60 @@ class BlobManager(ManagedAuthentication):
             filename = self.generate_uuid()
         if self.uuid is not None:
             self.uuid = None
+        # File objects and iterators are streamed in blocks; only sized
+        # payloads get a length hint.
         return self.container_client.upload_blob(
             name=filename,
             data=data,
             overwrite=overwrite,
             metadata=metadata,
-            length=len(data)
+            length=len(data) if hasattr(data, '__len__') else None,
+            max_concurrency=4
         ), filename
 
     def download(self, filename: str):
         if not self.container_client:
             return False
-        return self.container_client.download_blob(filename).content_as_bytes()
+        return self.container_client.download_blob(filename, max_concurrency=4).readall()
+
+    def download_to(self, filename: str, stream):
+        if not self.container_client:
+            return False
+        return self.container_client.download_blob(filename, max_concurrency=4).readinto(stream)
 
     def get_metadata(self, filename: str) -> dict:
         if not self.container_client:
             return {}
-        return self.container_client.get_blob_client(filename).get_blob_properties().metadata or {}
+        return self.blob_client(filename).get_blob_properties().metadata or {}
 
     def set_metadata(self, filename: str, metadata: dict):
         if not self.container_client:
             return {}
-        self.container_client.get_blob_client(filename).set_blob_metadata(metadata)
+        self.blob_client(filename).set_blob_metadata(metadata)
 
     def get_tags(self, filename: str) -> dict:
         if not self.container_client:
             return {}
-        return self.container_client.get_blob_client(filename).get_blob_tags() or {}
+        return self.blob_client(filename).get_blob_tags() or {}
 
     def set_tags(self, filename: str, tags: dict) -> dict:
         if not self.container_client:
             return {}
-        self.container_client.get_blob_client(filename).set_blob_tags(tags)
+        self.blob_client(filename).set_blob_tags(tags)
 
-    def get_properties(self, filename: str) -> dict:
+    def get_properties(self, filename: str, fields: list = None) -> dict:
         if not self.container_client:
             return {}
 
-        return dict(self.container_client.get_blob_client(filename).get_blob_properties()) or {}
+        properties = self.blob_client(filename).get_blob_properties()
+        if fields is not None:
+            return {field: getattr(properties, field, None) for field in fields}
+        return dict(properties) or {}
 
     def rm(self, filename: str):
         if not self.container_client:
             return False
+        self._blob_clients.pop(filename, None)
         return self.container_client.delete_blob(filename)
 
     def get_uuid(self) -> str:
@@ -187,9 +218,15 @@ class BlobManager(ManagedAuthentication):
             blob=blob
         ).download_blob()
 
-    def generate_uuid(self) -> str:
-        self.uuid = str(uuid())
-        for file in self.ls():
-            if file['name'] == self.uuid:
-                return self.generate_uuid()
-        return self.uuid
+    def generate_uuid(self, max_retries: int = 3) -> str:
+        # If every retry collides, upload(overwrite=False) will refuse it.
+        for _ in range(max_retries):
+            candidate = str(uuid())
+            if not self.container_client:
+                break
+            try:
+                self.container_client.get_blob_client(candidate).get_blob_properties()
+            except ResourceNotFoundError:
+                break
+        self.uuid = candidate
+        return candidate
@@ -7,8 +7,9 @@ from azure.mgmt.containerinstance.models import (
     ContainerGroupNetworkProtocol, ResourceIdentityType, ContainerExec, ContainerExecRequestTerminalSize, ContainerExecResponse)
 from azure.mgmt.containerinstance.models import ContainerGroupIdentity, ContainerGroupIdentityUserAssignedIdentitiesValue
 from msrestazure.azure_exceptions import CloudError
-from huepy import *
+from huepy import bad
 from shlex import quote
+from collections import deque
 import logging
 
 __authors__ = "Juan Ramón Higueras Pica (juanramon.higueras@wsg127.com)"
@@ -17,14 +18,19 @@ __coauthor__ = "Xavier Álvarez Delgado (xalvarez@merabytes.com)"
 logger = logging.getLogger('msrest.serialization')
 logger.disabled = True
 
+RESTART_POLICIES = ("Always", "OnFailure", "Never")
+
 class InstanceManager(ManagedAuthentication):
     def __init__(self, resource_group, login: bool = True, user_assigned: str = None, network_profile=None):
         if login:
             credential = self.get_credential(Resources.INSTANCE)
             subscription = self.extract_subscription(credential)
-            self._client = ContainerInstanceManagementClient(
-                credential,
-                subscription
+            self._client = self._shared_client(
+                subscription,
+                lambda: ContainerInstanceManagementClient(
+                    credential,
+                    subscription
+                )
             )
         self.resource_group = resource_group
         self.image_registry_credentials = None
@@ -52,29 +58,31 @@ class InstanceManager(ManagedAuthentication):
             'infinity'
         ], 
         image = 'ubuntu:20.04',
-        env_vars: dict = {}
+        env_vars: dict = {},
+        environment_variables: list = None,
+        resources: ResourceRequirements = None
     ):
-        env = {}
-
-        for env_key, env_val in env_vars.items():
-            env[env_key] = EnvironmentVariable(
-            name=env_key,
-            value=env_val
-        )
-        resource_request = ResourceRequests(
-            memory_in_gb=memory,
-            cpu=cpu
-        )
-        resource_requirement = ResourceRequirements(
-            requests=resource_request
-        )
+        # Prebuilt models can be passed in to share them between containers.
+        if environment_variables is None:
+            environment_variables = [
+                EnvironmentVariable(name=env_key, value=env_val)
+                for env_key, env_val in env_vars.items()
+            ]
+        if resources is None:
+            resource_request = ResourceRequests(
+                memory_in_gb=memory,
+                cpu=cpu
+            )
+            resources = ResourceRequirements(
+                requests=resource_request
+            )
         instance = Container(
             name=name,
             image=image,
-            resources=resource_requirement,
+            resources=resources,
             command=command,
             ports=ports,
-            environment_variables=list(env.values())
+            environment_variables=environment_variables
         )
         return instance
 
@@ -87,21 +95,29 @@ class InstanceManager(ManagedAuthentication):
         env_vars: dict = {}, command: str = None,
         input_files: list = None
     ):
-        restart_policies = ["Always", "OnFailure", "Never"]
-        if restart_policy not in restart_policies:
+        if restart_policy not in RESTART_POLICIES:
             raise ValueError((
                 "Unsupported restart policy \"%s\"."
                 "Please use one of the following: %s"
-                % (restart_policy, ", ".join(restart_policies))
+                % (restart_policy, ", ".join(RESTART_POLICIES))
             ))
-        if not self.image_registry_credentials:
-            ir_credentials = []
-        
-        if self.image_registry_credentials:
-            ir_credentials = [self.image_registry_credentials]
+        ir_credentials = [self.image_registry_credentials] if self.image_registry_credentials else []
 
-        max_ram = "{:.1f}".format(max_ram / (instance_number + 1))
-        max_cpu = "{:.1f}".format(max_cpu / (instance_number + 1)) 
+        # Every container gets the same share, so round it once up front.
+        memory = float("{:.1f}".format(max_ram / (instance_number + 1)))
+        cpu = float("{:.1f}".format(max_cpu / (instance_number + 1)))
+        resources = ResourceRequirements(
+            requests=ResourceRequests(
+                memory_in_gb=memory,
+                cpu=cpu
+            )
+        )
+        # Only INSTANCE_NAME differs between containers; the rest of the
+        # environment is built once and shared.
+        base_env = [
+            EnvironmentVariable(name=env_key, value=env_val)
+            for env_key, env_val in env_vars.items() if env_key != 'INSTANCE_NAME'
+        ]
 
         ok = False
         
@@ -112,40 +128,33 @@ class InstanceManager(ManagedAuthentication):
         if command:
             command = f"env/bin/python3 -m acido.cli -sh {quote(command)}"
 
+        # Inputs are handed out one per container, in order.
+        pending_inputs = deque(input_files) if input_files else None
+
         for i_num in range(1, instance_number + 1):
-            env_vars['INSTANCE_NAME'] = f'{name}-{i_num:02d}'
+            container_name = f'{name}-{i_num:02d}'
+            container_env = base_env + [
+                EnvironmentVariable(name='INSTANCE_NAME', value=container_name)
+            ]
             scan_cmd = command
 
-            if input_files:
-                file_uuid = input_files.pop(0)
+            if pending_inputs:
+                file_uuid = pending_inputs.popleft()
                 upload_command = f"env/bin/python3 -m acido.cli -d {file_uuid}"
                 if scan_cmd:
                     scan_cmd = upload_command + " && " + scan_cmd
                 else:
                     scan_cmd = upload_command
 
-            if scan_cmd:
-                deploy_instances.append(
-                    self.provision(
-                        f'{name}-{i_num:02d}', 
-                        memory=float(max_ram), 
-                        cpu=float(max_cpu), 
-                        image=image_name,
-                        env_vars=env_vars,
-                        command=["/bin/sh", "-c", scan_cmd]
-                        )
-                )
-            else:
-                deploy_instances.append(
-                    self.provision(
-                        f'{name}-{i_num:02d}', 
-                        memory=float(max_ram), 
-                        cpu=float(max_cpu), 
-                        image=image_name,
-                        env_vars=env_vars,
-                        command=scan_cmd
-                        )
+            deploy_instances.append(
+                self.provision(
+                    container_name, 
+                    image=image_name,
+                    environment_variables=container_env,
+                    resources=resources,
+                    command=["/bin/sh", "-c", scan_cmd] if scan_cmd else None
                     )
+            )
 
         try:
             cg = ContainerGroup(
@@ -164,20 +173,25 @@ class InstanceManager(ManagedAuthentication):
                     }
                 )
             )
+            # The group is only submitted here; callers wait on the
+            # containers themselves. polling=False stops the SDK from
+            # spinning up a background poller nobody reads.
             self._client.container_groups.create_or_update(
                 resource_group_name=self.resource_group,
                 container_group_name=name,
-                container_group=cg
+                container_group=cg,
+                polling=False
             )
             ok = True
-            for i_num in range(1, instance_number + 1):
-                results[f'{name}-{i_num:02d}'] = ok
+            results = {instance.name: ok for instance in deploy_instances}
         except CloudError as e:
             ok = False
             print(bad(e.message))
             raise e
 
         self.env_vars.clear()
+        if pending_inputs is not None:
+            input_files = list(pending_inputs)
         return results, input_files
 
     def rm(self, group_name):
@@ -218,7 +232,8 @@ class InstanceManager(ManagedAuthentication):
         try:
             self._client.container_groups.restart(
                 resource_group_name=self.resource_group,
-                container_group_name=group_name
+                container_group_name=group_name,
+                polling=False
             )
         except CloudError as e:
             if e.status_code == 404:
@@ -243,7 +258,8 @@ class InstanceManager(ManagedAuthentication):
         try:
             self._client.container_groups.start(
                 resource_group_name=self.resource_group,
-                container_group_name=group_name
+                container_group_name=group_name,
+                polling=False
             )
         except CloudError as e:
             if e.status_code == 404:
@@ -1,17 +1,66 @@
 import traceback
 import azure.common.credentials
-import azure.identity
-import msrestazure.azure_active_directory
 import os as _os
-import jwt as _jwt
+import base64
+import json
 import getpass
-from huepy import *
+from huepy import bad
 import sys
+from azure.core.pipeline.transport import RequestsTransport
+from requests import Session
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from threading import Lock
 
 __author__ = "Juan Ramón Higueras Pica (jrhigueras@dabbleam.com)"
 __coauthor__ = "Xavier Álvarez Delgado (xalvarez@merabytes.com)"
 
+ENVIRONMENT_CREDENTIAL_VARS = ("AZURE_TENANT_ID", "AZURE_CLIENT_ID", "AZURE_CLIENT_SECRET")
+
+def _token_claims(token: str) -> dict:
+    # Only the payload is read and the signature is not checked, so
+    # decode it directly instead of going through a JWT library.
+    payload = token.split('.')[1]
+    return json.loads(base64.urlsafe_b64decode(payload + '=' * (-len(payload) % 4)))
+
+# Shared by the CLI worker pools and the HTTP connection pools, so
+# concurrent SDK calls keep their connections alive instead of
+# overflowing requests' default 10.
+POOL_SIZE = 30
+
 class ManagedAuthentication:
+    # `az` profile lookups and MSI credentials (each one fetches a token
+    # when built) are shared by every manager in the process.
+    _cli_credentials = None
+    _msi_credentials = {}
+    _credentials_lock = Lock()
+    # Management clients (and their connection pools), one per manager
+    # class and subscription.
+    _clients = {}
+    _clients_lock = Lock()
+
+    @classmethod
+    def _shared_client(cls, subscription, factory):
+        key = (cls, subscription)
+        with ManagedAuthentication._clients_lock:
+            client = ManagedAuthentication._clients.get(key)
+            if client is None:
+                client = factory()
+                ManagedAuthentication._clients[key] = client
+        return client
+
+    @staticmethod
+    def transport(pool_size: int = POOL_SIZE) -> RequestsTransport:
+        session = Session()
+        # Retries are handled by the azure-core pipeline, not urllib3.
+        adapter = HTTPAdapter(
+            pool_connections=pool_size,
+            pool_maxsize=pool_size,
+            max_retries=Retry(total=False, redirect=False, raise_on_status=False)
+        )
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        return RequestsTransport(session=session)
 
     @property
     def client_id(self) -> str:
@@ -61,21 +110,35 @@ class ManagedAuthentication:
             raise NotImplementedError(f"Unrecognized resource: {resource}")
 
     def _get_managed_identity_credential(self):
-        return azure.identity.ManagedIdentityCredential(
+        from azure.identity import ManagedIdentityCredential
+        return ManagedIdentityCredential(
             client_id=self.client_id
         )
 
     def _get_msi_credential(self, resource):
-        return msrestazure.azure_active_directory.MSIAuthentication(
-            resource=resource,
-            client_id=self.client_id
-        )
+        key = (resource, self.client_id)
+        with ManagedAuthentication._credentials_lock:
+            credential = ManagedAuthentication._msi_credentials.get(key)
+            if credential is None:
+                from msrestazure.azure_active_directory import MSIAuthentication
+                credential = MSIAuthentication(
+                    resource=resource,
+                    client_id=self.client_id
+                )
+                ManagedAuthentication._msi_credentials[key] = credential
+        return credential
+
+    @staticmethod
+    def _azure_cli_credentials():
+        with ManagedAuthentication._credentials_lock:
+            if ManagedAuthentication._cli_credentials is None:
+                ManagedAuthentication._cli_credentials = azure.common.credentials.get_azure_cli_credentials()
+            return ManagedAuthentication._cli_credentials
 
     def get_cli_credential(self, resource):
         try:
-            cred, sub = azure.common.credentials.get_azure_cli_credentials()
+            cred, sub = self._azure_cli_credentials()
         except Exception:
-            import traceback
             print(traceback.format_exc())
             return None
         return cred
@@ -84,7 +147,8 @@ class ManagedAuthentication:
         tenant_id = input("Enter TENANT_ID: ")
         client_id = input("Enter CLIENT_ID: ")
         client_secret = getpass.getpass("Enter CLIENT_SECRET: ")
-        return azure.identity.ClientSecretCredential(
+        from azure.identity import ClientSecretCredential
+        return ClientSecretCredential(
             tenant_id=tenant_id,
             client_id=client_id,
             client_secret=client_secret
@@ -93,14 +157,11 @@ class ManagedAuthentication:
     def get_environment_credential(self, resource):
         if self._environment_ok() is False:
             return False
-        return azure.identity.EnvironmentCredential()
+        from azure.identity import EnvironmentCredential
+        return EnvironmentCredential()
 
     def _environment_ok(self):
-        checks = ["AZURE_TENANT_ID", "AZURE_CLIENT_ID", "AZURE_CLIENT_SECRET"]
-        for check in checks:
-            if check not in _os.environ:
-                return False
-        return True
+        return all(var in _os.environ for var in ENVIRONMENT_CREDENTIAL_VARS)
 
     def is_cloud(self):
         force = "INSTANCE_NAME" in _os.environ
@@ -109,15 +170,16 @@ class ManagedAuthentication:
         return force or auto
 
     def extract_subscription(self, credential):
+        if not credential:
+            print(bad('Please run az login to refresh credentials.'))
+            sys.exit()
+        subscription = _os.getenv("AZURE_SUBSCRIPTION_ID")
+        if subscription:
+            return subscription
         if isinstance(credential, azure.common.credentials._CliCredentials):
-            return azure.common.credentials.get_azure_cli_credentials()[1]
-        else:
-            if credential:
-                obj = _jwt.decode(credential.token['access_token'], verify=False)
-                return obj['xms_mirid'].split("/")[2]
-            else:
-                print(bad('Please run az login to refresh credentials.'))
-                sys.exit()
+            return self._azure_cli_credentials()[1]
+        obj = _token_claims(credential.token['access_token'])
+        return obj['xms_mirid'].split("/")[2]
 
 
 class Resources:
@@ -1,3 +1,4 @@
+from azure.core.exceptions import HttpResponseError
 from azure.mgmt.network import NetworkManagementClient
 from azure.mgmt.network.models import Delegation, VirtualNetwork, Subnet, NetworkProfile, PublicIPAddressSku, NatGatewaySku, SubResource, NatGateway
 from acido.azure_utils.ManagedIdentity import ManagedAuthentication, Resources
@@ -6,29 +7,47 @@ from huepy import good, bad, info, bold, green, red, orange
 __authors__ = "Juan Ramón Higueras Pica (jrhigueras@dabbleam.com)"
 __coauthor__ = "Xavier Álvarez Delgado (xalvarez@merabytes.com)"
 
+# Seconds between LRO status checks when ARM sends no Retry-After. The SDK
+# default of 30s is longer than most of these deployments take.
+POLLING_INTERVAL = 5
+
 class NetworkManager(ManagedAuthentication):
     def __init__(self, resource_group, login: bool = True, user_assigned: str = None, ip_address: str = None):
         self.resource_group = resource_group
         self.location = 'westeurope'
         self.ip_address = ip_address
+        # Network profiles this instance created, keyed by name, so a
+        # lookup right after creation does not go back to ARM.
+        self._network_profiles = {}
         
         if login:
             credential = self.get_credential(Resources.NETWORK)
             subscription = self.extract_subscription(credential)
-            self._client = NetworkManagementClient(credential, subscription)
+            self._client = self._shared_client(
+                subscription,
+                lambda: NetworkManagementClient(
+                    credential,
+                    subscription,
+                    transport=NetworkManager.transport()
+                )
+            )
 
-    def delete_resources(self, create_ip):
+    # The begin_* methods return the SDK poller without waiting on it, so
+    # callers can start independent deployments and collect them together.
+    def begin_delete_resources(self, create_ip):
         # Construct the names based on create_ip
         network_profile_name = f"{create_ip}-network-profile"
-        cnic_name = f"{create_ip}-cnic"
-        ip_config_name = f"{create_ip}-ip-config"
         
         # Delete Network Profile
-        delete_network_profile_operation = self._client.network_profiles.begin_delete(
+        self._network_profiles.pop(network_profile_name, None)
+        return self._client.network_profiles.begin_delete(
             self.resource_group,
-            network_profile_name
+            network_profile_name,
+            polling_interval=POLLING_INTERVAL
         )
-        delete_network_profile_result = delete_network_profile_operation.result()
+
+    def delete_resources(self, create_ip):
+        delete_network_profile_result = self.begin_delete_resources(create_ip).result()
         
         # Logic to delete CNIC and IP config can be added if they are separate resources.
         # In this case, deleting the network profile might already delete associated CNIC and IP configurations.
@@ -38,6 +57,8 @@ class NetworkManager(ManagedAuthentication):
     def get_network_profile(self, resource_name: str) -> NetworkProfile:
         # Construct the network profile name based on create_ip
         network_profile_name = f"{resource_name}-network-profile"
+        if network_profile_name in self._network_profiles:
+            return self._network_profiles[network_profile_name]
         
         # Get the network profile
         try:
@@ -46,53 +67,59 @@ class NetworkManager(ManagedAuthentication):
                 network_profile_name
             )
             return network_profile
-        except Exception as e:
+        except HttpResponseError as e:
             print(f"Failed to get network profile: {e}")
             return None
     
-    def create_ipv4(self, public_ip_name):
+    def begin_create_ipv4(self, public_ip_name):
         public_ip_params = {
             'location': 'westeurope',  # Modify this to your preferred location
             'public_ip_allocation_method': 'Static',
             'public_ip_address_version': 'IPv4',
             'sku': PublicIPAddressSku(name='Standard', tier="Regional")
         }
-        async_creation = self._client.public_ip_addresses.begin_create_or_update(
+        return self._client.public_ip_addresses.begin_create_or_update(
             self.resource_group,
             public_ip_name,
-            public_ip_params
+            public_ip_params,
+            polling_interval=POLLING_INTERVAL
         )
-        public_ip_address = async_creation.result()
+
+    def create_ipv4(self, public_ip_name):
+        public_ip_address = self.begin_create_ipv4(public_ip_name).result()
         print(good(f"Public IP Address {public_ip_address.id} created successfully."))
         return public_ip_address.id
 
-    def list_ipv4(self):
-        ip_addresses_list = self._client.public_ip_addresses.list(self.resource_group)
-
-        ip_addresses_info = [
-            {
+    def iter_ipv4(self):
+        # Yields as the SDK pages in results, so callers can start working
+        # on the first page before the rest has been fetched.
+        for ip in self._client.public_ip_addresses.list(self.resource_group):
+            yield {
                 'id': ip.id,
                 'name': ip.name,
                 'ip_address': ip.ip_address,
                 'location': ip.location
             }
-            for ip in ip_addresses_list
-        ]
 
-        return ip_addresses_info
+    def list_ipv4(self):
+        return list(self.iter_ipv4())
     
-    def create_virtual_network(self, vnet_name):
+    def begin_create_virtual_network(self, vnet_name):
         vnet_params = VirtualNetwork(
             location=self.location,  # Assume `self.location` contains the Azure region
             address_space={
                 "address_prefixes": ["10.0.0.0/16"]  # Adjust as needed
             }
         )
-        creation_result = self._client.virtual_networks.begin_create_or_update(
+        return self._client.virtual_networks.begin_create_or_update(
             self.resource_group,
             vnet_name,
-            vnet_params
-        ).result()
+            vnet_params,
+            polling_interval=POLLING_INTERVAL
+        )
+
+    def create_virtual_network(self, vnet_name):
+        creation_result = self.begin_create_virtual_network(vnet_name).result()
         print(good(f"Virtual Network {creation_result.id} created successfully."))
         return creation_result
 
@@ -105,7 +132,8 @@ class NetworkManager(ManagedAuthentication):
         nat_gateway = self._client.nat_gateways.begin_create_or_update(
             resource_group_name=self.resource_group,
             nat_gateway_name=f'{subnet_name}-nat-gw',
-            parameters=nat_gateway_params
+            parameters=nat_gateway_params,
+            polling_interval=POLLING_INTERVAL
         ).result()
         print(good(f"NAT Gateway {nat_gateway.id} created successfully."))
         subnet_params = Subnet(
@@ -122,7 +150,8 @@ class NetworkManager(ManagedAuthentication):
             self.resource_group,
             vnet_name,
             subnet_name,
-            subnet_params
+            subnet_params,
+            polling_interval=POLLING_INTERVAL
         ).result()
         print(good(f"Subnet {creation_result.id} created successfully."))
         return creation_result
@@ -133,5 +162,6 @@ class NetworkManager(ManagedAuthentication):
             network_profile_name,
             network_profile_params
         )
+        self._network_profiles[network_profile_name] = creation_result
         return creation_result
 
@@ -1,27 +1,12 @@
 import argparse
-from asyncore import write
 import json
-import traceback
 import subprocess
-from beaupy import select
-from azure.mgmt.network.models import ContainerNetworkInterfaceConfiguration, ContainerNetworkInterfaceIpConfiguration, IPConfigurationProfile
-from azure.mgmt.containerinstance.models import ContainerGroupNetworkProfile
-from acido.azure_utils.BlobManager import BlobManager
-from acido.azure_utils.InstanceManager import *
-from acido.azure_utils.NetworkManager import *
-from acido.azure_utils.ManagedIdentity import ManagedAuthentication
-from msrestazure.azure_exceptions import CloudError
-from acido.utils.functions import chunks, jpath, expanduser, split_file
-from huepy import good, bad, info, bold, green, red, orange
 from multiprocessing.pool import ThreadPool
-import code
 import re
 import os
-import sys
 import time
-from os import mkdir, getenv
+from os import mkdir
 from acido.utils.decoration import BANNER, __version__
-from acido.utils.shell_utils import wait_command, exec_command
 
 __author__ = "Xavier Alvarez Delgado (xalvarez@merabytes.com)"
 __coauthor__ = "Juan Ramón Higueras Pica (jrhigueras@dabbleam.com)"
@@ -102,15 +87,33 @@ parser.add_argument("-rwd", "--rm-when-done",
                     dest="rm_when_done",
                     help="Remove the container groups after finish.",
                     action='store_true')
+parser.add_argument("-v", "--version",
+                    action='version',
+                    version=f'acido {__version__}')
 
 
+# Parse before loading the Azure SDK so that --help, --version and
+# usage errors exit without paying for it.
 args = parser.parse_args()
+
+from acido.azure_utils.BlobManager import BlobManager
+from acido.azure_utils.InstanceManager import InstanceManager
+from acido.azure_utils.ManagedIdentity import POOL_SIZE
+from acido.utils.functions import chunks, jpath, expanduser, split_file
+from huepy import good, bad, info, bold, green, red, orange
+from acido.utils.shell_utils import wait_command, exec_command
+
 instances_outputs = {}
 
 def build_output(result):
     global instances_outputs
     instances_outputs[result[0]] = [result[1], result[2]]
 
+def selection_pattern(selection):
+    # Turns a `group-*` style selection into one compiled, anchored
+    # pattern that can be matched against every group name.
+    return re.compile(f'^{selection.replace("*", "(.*)")}$')
+
 
 class Acido(object):
 
@@ -126,6 +129,10 @@ class Acido(object):
         self.user_assigned = None
         self.rg = None
         self.network_profile = None
+        self._network_manager = None
+        # Filled in by ls(); every command that needs them lists first.
+        self.all_instances = {}
+        self.instances_named = {}
 
         if rg:
             self.rg = rg
@@ -160,9 +167,6 @@ class Acido(object):
         self.instance_manager = im
         self.blob_manager = BlobManager(resource_group=self.rg, account_name='acido')
         self.blob_manager.use_container(container_name='acido', create_if_not_exists=True)
-        self.all_instances, self.instances_named = self.ls(interactive=False)
-
-        self.network_manager = NetworkManager(resource_group=self.rg)
 
         if args.create_ip:
             public_ip_name = args.create_ip
@@ -175,6 +179,14 @@ class Acido(object):
         self.instance_manager.network_profile = self.network_profile
 
 
+    @property
+    def network_manager(self):
+        if self._network_manager is None and self.rg:
+            # The network SDK is only needed by the IP commands.
+            from acido.azure_utils.NetworkManager import NetworkManager
+            self._network_manager = NetworkManager(resource_group=self.rg)
+        return self._network_manager
+
     def _save_config(self):
         home = expanduser("~")
         config = {
@@ -198,8 +210,7 @@ class Acido(object):
             pass
 
         with open(jpath(f'{home}', '.acido', 'config.json'), 'w') as conf:
-            conf.write(json.dumps(config, indent=4))
-            conf.close()
+            json.dump(config, conf, indent=4)
 
         return True
         
@@ -207,7 +218,7 @@ class Acido(object):
     def _load_config(self):
         home = expanduser("~")
         with open(jpath(f'{home}', '.acido', 'config.json'), 'r') as conf:
-            config = json.loads(conf.read())
+            config = json.load(conf)
         
         for key, value in config.items():
             if key == 'rg' and self.rg is not None:
@@ -218,6 +229,10 @@ class Acido(object):
         self._save_config()
 
     def create_ipv4_address(self, public_ip_name):
+        from azure.mgmt.network.models import (
+            ContainerNetworkInterfaceConfiguration, IPConfigurationProfile, NetworkProfile
+        )
+
         if self.network_manager is None:
             print(bad("Network manager is not initialized. Please provide a resource group."))
             return
@@ -225,13 +240,16 @@ class Acido(object):
         # Step 0: Delete NetworkProfile
         # self.network_manager.delete_resources(public_ip_name)
 
-        # Step 1: Create a new Public IP Address
-        ipv4_address_id = self.network_manager.create_ipv4(public_ip_name)
-
-        # Step 2: Create a Virtual Network
+        # Step 1 & 2: Create a new Public IP Address and a Virtual Network.
+        # They don't depend on each other, so both deployments run at once.
         vnet_name = f'{public_ip_name}-vnet'
         subnet_name = f'{public_ip_name}-subnet'
-        vnet_params = self.network_manager.create_virtual_network(vnet_name)
+        ipv4_poller = self.network_manager.begin_create_ipv4(public_ip_name)
+        vnet_poller = self.network_manager.begin_create_virtual_network(vnet_name)
+        ipv4_address_id = ipv4_poller.result().id
+        print(good(f"Public IP Address {ipv4_address_id} created successfully."))
+        vnet_params = vnet_poller.result()
+        print(good(f"Virtual Network {vnet_params.id} created successfully."))
         subnet_params = self.network_manager.create_subnet(vnet_name, subnet_name, ip_address=ipv4_address_id)
 
         # Step 3: Create a Network Profile
@@ -260,15 +278,17 @@ class Acido(object):
 
 
     def select_ipv4_address(self):
+        from beaupy import select
+
         if self.network_manager is None:
             print(bad("Network manager is not initialized. Please provide a resource group."))
             return
         
-        ip_addresses_info = self.network_manager.list_ipv4()
-        
-        # Create a list of IP addresses and an associated descriptive list
-        ip_addresses = [info['ip_address'] for info in ip_addresses_info if info['ip_address']]  # Filter out None values
-        ip_descriptions = [f"{info['name']} ({info['ip_address']})" for info in ip_addresses_info if info['ip_address']]  # Filter out None values
+        # Build the descriptive list in a single pass over the listing
+        ip_descriptions = [
+            f"{info['name']} ({info['ip_address']})"
+            for info in self.network_manager.iter_ipv4() if info['ip_address']  # Filter out None values
+        ]
         
         # Now use beaupy to create an interactive selector.
         print(good("Please select an IP address:"))
@@ -277,7 +297,11 @@ class Acido(object):
         # Extract the selected IP address from the description
         selected_ip_address = selected_description.split(' ')[-1][1:-1]  # Assumes the format is 'name (ip_address)'
         network_profile_prefix = selected_description.split(' ')[0]  # Assumes the format is 'name (ip_address)'
-        self.network_profile = {'id': self.network_manager.get_network_profile(resource_name=network_profile_prefix).id}
+        network_profile = self.network_manager.get_network_profile(resource_name=network_profile_prefix)
+        if network_profile is None:
+            print(bad(f"No network profile found for {network_profile_prefix}. Create it with --create-ip first."))
+            return
+        self.network_profile = {'id': network_profile.id}
         self._save_config()
         
         print(good(f"You selected IP address: {selected_ip_address} from network profile {self.network_profile}"))
@@ -287,16 +311,13 @@ class Acido(object):
         all_instances_names = {}
         all_instances_states = {}
         all_names = []
-        instances = self.instance_manager.ls()
-        while instances:
-            try:
-                container_group = instances.next()
-                all_instances[container_group.name] = [c for c in container_group.containers]
-                all_instances_names[container_group.name] = [c.name for c in container_group.containers]
+        for container_group in self.instance_manager.ls():
+            container_names = [c.name for c in container_group.containers]
+            all_instances[container_group.name] = list(container_group.containers)
+            all_instances_names[container_group.name] = container_names
+            all_names += container_names
+            if interactive:
                 all_instances_states[container_group.name] = green(container_group.provisioning_state) if container_group.provisioning_state == 'Succeeded' else orange(container_group.provisioning_state)
-                all_names += [c.name for c in container_group.containers]
-            except StopIteration:
-                break
         if interactive:
             print(good(f"Listing all instances: [ {bold(' '.join(all_names))} ]"))
             print(good(f"Container group status: [ {' '.join([f'{bold(cg)}: {status}' for cg, status in all_instances_states.items()])} ]"))
@@ -304,8 +325,8 @@ class Acido(object):
     
     def select(self, selection, interactive=True):
         self.all_instances, self.instances_named = self.ls(interactive=False)
-        selection = f'^{selection.replace("*", "(.*)")}$'
-        self.selected_instances = [scg for scg, i in self.instances_named.items() if bool(re.match(selection, scg))]
+        pattern = selection_pattern(selection)
+        self.selected_instances = [scg for scg in self.instances_named if pattern.match(scg)]
         self._save_config()
         print(good(f"Selected all instances of group/s: [ {bold(' '.join(self.selected_instances))} ]"))
         return None if interactive else self.selected_instances
@@ -313,57 +334,57 @@ class Acido(object):
     def fleet(self, fleet_name, instance_num=3, image_name=None, scan_cmd=None, input_file=None, wait=None, write_to_file=None, interactive=True):
         response = {}
         input_files = None
+        env_vars = {
+            'RG': self.rg,
+            'IMAGE_REGISTRY_SERVER': self.image_registry_server,
+            'IMAGE_REGISTRY_USERNAME': self.image_registry_username,
+            'IMAGE_REGISTRY_PASSWORD': self.image_registry_password,
+            'BLOB_CONNECTION': (
+                "DefaultEndpointsProtocol=https;"
+                f"AccountName={self.blob_manager.account_name};AccountKey={self.blob_manager.account_key};"
+                "EndpointSuffix=core.windows.net"
+            )
+        }
         if instance_num > 10:
             instance_num_groups = list(chunks(range(1, instance_num + 1), 10))
             
             if input_file:
                 input_filenames = split_file(input_file, instance_num)
-                input_files = [self.save_input(f) for f in input_filenames]
+                input_files = self.save_inputs(input_filenames)
                 print(good(f'Uploaded {len(input_files)} target lists.'))
 
-            for cg_n, ins_num in enumerate(instance_num_groups):
-                last_instance = len(ins_num)
-                env_vars = {
-                    'RG': self.rg,
-                    'IMAGE_REGISTRY_SERVER': self.image_registry_server,
-                    'IMAGE_REGISTRY_USERNAME': self.image_registry_username,
-                    'IMAGE_REGISTRY_PASSWORD': self.image_registry_password,
-                    'BLOB_CONNECTION': (
-                        "DefaultEndpointsProtocol=https;"
-                        f"AccountName={self.blob_manager.account_name};AccountKey={self.blob_manager.account_key};"
-                        "EndpointSuffix=core.windows.net"
-                    )
-                }
-                group_name = f'{fleet_name}-{cg_n+1:02d}'
-
-                if group_name not in response.keys():
-                    response[group_name] = []
-                
-                response[group_name], input_files = self.instance_manager.deploy(
+            # Groups are independent deployments, so they are submitted
+            # concurrently. Each one gets its own slice of the uploaded
+            # inputs.
+            deployments = {}
+            first_instance = 0
+            with ThreadPool(processes=min(len(instance_num_groups), POOL_SIZE)) as workers:
+                for cg_n, ins_num in enumerate(instance_num_groups):
+                    last_instance = len(ins_num)
+                    group_name = f'{fleet_name}-{cg_n+1:02d}'
+                    group_input_files = None
+                    if input_files:
+                        group_input_files = input_files[first_instance:first_instance + last_instance]
+                    first_instance += last_instance
+
+                    deployments[group_name] = workers.apply_async(
+                        self.instance_manager.deploy,
+                        kwds=dict(
                             name=group_name, 
                             instance_number=last_instance, 
                             image_name=image_name,
-                            input_files=input_files,
+                            input_files=group_input_files,
                             command=scan_cmd,
                             network_profile=self.network_profile,
-                            env_vars=env_vars)
+                            env_vars=env_vars))
+
+                for group_name, deployment in deployments.items():
+                    response[group_name], _ = deployment.get()
         else:
 
             if input_file:
                 input_filenames = split_file(input_file, instance_num)
-                input_files = [self.save_input(f) for f in input_filenames]
-
-            env_vars = {
-                    'RG': self.rg,
-                    'IMAGE_REGISTRY_SERVER': self.image_registry_server,
-                    'IMAGE_REGISTRY_USERNAME': self.image_registry_username,
-                    'IMAGE_REGISTRY_PASSWORD': self.image_registry_password,
-                    'BLOB_CONNECTION': (
-                        "DefaultEndpointsProtocol=https;"
-                        f"AccountName={self.blob_manager.account_name};AccountKey={self.blob_manager.account_key};"
-                        "EndpointSuffix=core.windows.net"
-                    )
-            }
+                input_files = self.save_inputs(input_filenames)
 
             response[fleet_name], input_files = self.instance_manager.deploy(
                 name=fleet_name, 
@@ -401,20 +422,26 @@ class Acido(object):
                     results.append(result)
 
             results = [result.wait() for result in results]
+            downloads = {
+                c: pool.apply_async(self.load_input, (o[0],))
+                for c, o in instances_outputs.items() if o[0]
+            }
 
             for c, o in instances_outputs.items():
                 command_uuid, exception = o
                 if command_uuid:
-                    output = self.load_input(command_uuid)
+                    output = downloads[c].get()
                     print(good(f'Executed command on {bold(c)}. Output: [\n{output.decode().strip()}\n]'))
                     outputs[c] = output.decode()
                 elif exception:
                     print(bad(f'Executed command on {bold(c)} Output: [\n{exception}\n]'))
             
             if write_to_file:
-                open(write_to_file, 'w').write(json.dumps(outputs, indent=4))
+                with open(write_to_file, 'w') as f:
+                    json.dump(outputs, f, indent=4)
                 print(good(f'Saved container outputs at: {write_to_file}.json'))
-                open(f'all_{write_to_file}.txt', 'w').write('\n'.join([o.rstrip() for o in outputs.values()]))
+                with open(f'all_{write_to_file}.txt', 'w') as f:
+                    f.write('\n'.join(o.rstrip() for o in outputs.values()))
                 print(good(f'Saved merged outputs at: all_{write_to_file}.txt'))
 
         return None if interactive else response, outputs
@@ -423,11 +450,13 @@ class Acido(object):
     def rm(self, selection):
         self.all_instances, self.instances_named = self.ls(interactive=False)
         response = {}
-        selection = f'^{selection.replace("*", "(.*)")}$'
-        removable_instances = [cg for cg, i in self.instances_named.items() if bool(re.match(selection, cg))]
+        pattern = selection_pattern(selection)
+        removable_instances = [cg for cg in self.instances_named if pattern.match(cg)]
 
-        for erased_group in removable_instances:
-            response[erased_group] = self.instance_manager.rm(erased_group)
+        if removable_instances:
+            with ThreadPool(processes=min(len(removable_instances), POOL_SIZE)) as workers:
+                statuses = workers.map(self.instance_manager.rm, removable_instances)
+            response = dict(zip(removable_instances, statuses))
 
         for group, status in response.items():
             if status:
@@ -450,22 +479,29 @@ class Acido(object):
         return output
 
     def save_input(self, filename: str = None):
-        file_contents = open(filename, 'rb').read()
-        file, filename = self.blob_manager.upload(
-            file_contents
-        )
+        with open(filename, 'rb') as file_contents:
+            file, filename = self.blob_manager.upload(
+                file_contents
+            )
         if file:
             return filename
         else:
             print(bad(f'Exception occurred while uploading file.'))
             return None
+
+    def save_inputs(self, filenames: list):
+        with ThreadPool(processes=POOL_SIZE) as workers:
+            return workers.map(self.save_input, filenames)
     
     def load_input(self, command_uuid: str = None, filename: str = 'input', write_to_file: bool = False):
+        input_file = None
         if command_uuid:
-            input_file = self.blob_manager.download(command_uuid)
             if write_to_file:
-                open(filename, 'wb').write(input_file)
+                with open(filename, 'wb') as f:
+                    self.blob_manager.download_to(command_uuid, f)
                 print(good(f'File loaded successfully.'))
+            else:
+                input_file = self.blob_manager.download(command_uuid)
         return input_file
 
     def exec(self, command, max_retries=60, input_file: str = None, write_to_file: str =None):
@@ -477,34 +513,24 @@ class Acido(object):
             print(bad('You didn\'t select any containers to execute the command.'))
             return
 
+        selected = set(self.selected_instances)
+        targets = [
+            (cg, cont)
+            for cg, containers in self.instances_named.items() if cg in selected
+            for cont in containers
+        ]
+
         if input_file:
-            number_of_containers = 0
-            for cg, containers in self.instances_named.items():
-                if cg in self.selected_instances:
-                    for cont in containers:
-                        number_of_containers += 1
-
-            input_files = split_file(input_file, number_of_containers)
-            input_file_index = 0
-            
-            for cg, containers in self.instances_named.items():
-                if cg in self.selected_instances:
-                    for cont in containers:
-                        executed = True
-                        result = pool.apply_async(exec_command, 
-                                                (self.rg, cg, cont, command, max_retries, input_files[input_file_index]), 
-                                                callback=build_output)
-                        results.append(result)
-                        input_file_index += 1
+            input_files = split_file(input_file, len(targets))
         else:
-            for cg, containers in self.instances_named.items():
-                if cg in self.selected_instances:
-                    for cont in containers:
-                        executed = True
-                        result = pool.apply_async(exec_command, 
-                                                (self.rg, cg, cont, command, max_retries, input_file), 
-                                                callback=build_output)
-                        results.append(result)
+            input_files = [input_file] * len(targets)
+
+        for (cg, cont), container_input in zip(targets, input_files):
+            executed = True
+            result = pool.apply_async(exec_command, 
+                                    (self.rg, cg, cont, command, max_retries, container_input), 
+                                    callback=build_output)
+            results.append(result)
         
         if not executed:
             print(bad('An error happened. You probably didn\'t select any containers to execute the command.'))
@@ -512,11 +538,15 @@ class Acido(object):
         
         results = [result.wait() for result in results]
         outputs = {}
+        downloads = {
+            c: pool.apply_async(self.load_input, (o[0],))
+            for c, o in instances_outputs.items() if o[0]
+        }
 
         for c, o in instances_outputs.items():
             command_uuid, exception = o
             if command_uuid:
-                output = self.load_input(command_uuid)
+                output = downloads[c].get()
                 print(good(f'Executed command on {bold(c)}. Output: [\n{output.decode().strip()}\n]'))
                 outputs[c] = output.decode()
             elif exception:
@@ -526,9 +556,11 @@ class Acido(object):
                     print(bad(f'Executed command on {bold(c)} Output: [\n{exception}\n]'))
         
         if write_to_file:
-            open(f'{write_to_file}.json', 'w').write(json.dumps(outputs, indent=4))
+            with open(f'{write_to_file}.json', 'w') as f:
+                json.dump(outputs, f, indent=4)
             print(good(f'Saved JSON output at: {write_to_file}'))
-            open(f'all_{write_to_file}', 'w').write('\n'.join([o.rstrip() for o in outputs.values()]))
+            with open(f'all_{write_to_file}', 'w') as f:
+                f.write('\n'.join(o.rstrip() for o in outputs.values()))
             print(good(f'Saved merged outputs at: {write_to_file}'))
 
 
@@ -559,7 +591,7 @@ if __name__ == "__main__":
     if args.download_input:
         acido.load_input(args.download_input, write_to_file=True)
     if args.fleet:
-        pool = ThreadPool(processes=30)
+        pool = ThreadPool(processes=POOL_SIZE)
         args.num_instances = int(args.num_instances) if args.num_instances else 1
         acido.fleet(
             fleet_name=args.fleet, 
@@ -576,7 +608,7 @@ if __name__ == "__main__":
     if args.select:
         acido.select(selection=args.select, interactive=bool(args.interactive))
     if args.exec_cmd:
-        pool = ThreadPool(processes=30)
+        pool = ThreadPool(processes=POOL_SIZE)
         acido.exec(
             command=args.exec_cmd, 
             max_retries=int(args.wait) if args.wait else 60, 
@@ -586,4 +618,5 @@ if __name__ == "__main__":
     if args.remove:
         acido.rm(args.remove)
     if args.interactive:
+        import code
         code.interact(banner=f'acido {__version__}', local=locals())
\ No newline at end of file
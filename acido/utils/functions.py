@@ -1,4 +1,4 @@
-from huepy import *
+from huepy import good
 import time
 import subprocess
 import os
@@ -31,7 +31,8 @@ def chunks(iterable, chunk_size):
             break
 
 def split_file(input_file, number_of_containers):
-    number_of_lines = len([line.strip() for line in open(input_file, 'r').readlines()])
+    with open(input_file, 'r') as f:
+        number_of_lines = sum(1 for _ in f)
     chunked_lines = int(number_of_lines / number_of_containers)
     print(good(f'Splitting into {number_of_containers} files.'))
     os.system(f'split -l {str(chunked_lines)} {input_file} /tmp/acido-input-')
@@ -7,11 +7,6 @@ def wait_command(rg, cg, cont, wait=None):
     time_spent = 0
     exception = None
     command_uuid = None
-    container_logs = subprocess.check_output(
-        f'az container logs --resource-group {rg} --name {cg} --container-name {cont}', 
-        shell=True
-    )
-    container_logs = container_logs.decode()
 
     while True:
         container_logs = subprocess.check_output(
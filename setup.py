@@ -32,7 +32,6 @@ setup(
         'azure.identity==1.3',
         'azure.keyvault.secrets==4.2.0',
         'azure.storage.blob==12.7.1',
-        'PyJWT==1.7.1',
         'websockets',
         'huepy',
         'msrestazure',